@@ -12,15 +12,136 @@ File: app.py
 
 from flask import Flask, jsonify, request
 from recommender_engine import RecommenderEngine, LLMExplainer
+from collections import OrderedDict
+import functools
 import json
+import os
+import pickle
+import threading
+import time
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 app = Flask(__name__)
 
+
+if orjson is not None:
+    from flask.json.provider import JSONProvider
+
+    class OrjsonProvider(JSONProvider):
+        """Serialize responses with orjson (handles numpy scalars natively)"""
+        
+        options = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS | orjson.OPT_SORT_KEYS
+        
+        def dumps(self, obj, **kwargs):
+            return orjson.dumps(obj, option=self.options).decode()
+        
+        def loads(self, s, **kwargs):
+            return orjson.loads(s)
+        
+        def response(self, *args, **kwargs):
+            obj = self._prepare_response_obj(args, kwargs)
+            return self._app.response_class(
+                orjson.dumps(obj, option=self.options),
+                mimetype="application/json"
+            )
+
+    app.json = OrjsonProvider(app)
+
+# Response cache: Redis when REDIS_URL is set, otherwise an in-process LRU
+CACHE_TTL = 300
+LOCAL_CACHE_SIZE = 1024
+CACHE_PREFIX = "recommender"
+
+redis_client = None
+if os.environ.get("REDIS_URL"):
+    try:
+        import redis
+        redis_client = redis.Redis.from_url(os.environ["REDIS_URL"])
+        redis_client.ping()
+        print("✅ Redis cache connected")
+    except Exception as e:
+        print(f"⚠️ Redis unavailable, using in-process cache: {e}")
+        redis_client = None
+
+_local_cache = OrderedDict()
+_local_cache_lock = threading.Lock()
+
+
+def _cache_get(key):
+    if redis_client is not None:
+        try:
+            data = redis_client.get(key)
+            return pickle.loads(data) if data is not None else None
+        except Exception:
+            return None
+    
+    with _local_cache_lock:
+        entry = _local_cache.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del _local_cache[key]
+            return None
+        _local_cache.move_to_end(key)
+        return value
+
+
+def _cache_set(key, value, ttl):
+    if redis_client is not None:
+        try:
+            redis_client.setex(key, ttl, pickle.dumps(value))
+        except Exception:
+            pass
+        return
+    
+    with _local_cache_lock:
+        _local_cache[key] = (time.monotonic() + ttl, value)
+        _local_cache.move_to_end(key)
+        while len(_local_cache) > LOCAL_CACHE_SIZE:
+            _local_cache.popitem(last=False)
+
+
+def invalidate_user(user_id):
+    """Drop every cached response for a user"""
+    if redis_client is not None:
+        try:
+            for key in redis_client.scan_iter(match=f"{CACHE_PREFIX}:{user_id}:*"):
+                redis_client.delete(key)
+        except Exception:
+            pass
+        return
+    
+    with _local_cache_lock:
+        for key in [k for k in _local_cache if k.split(":")[1] == str(user_id)]:
+            del _local_cache[key]
+
+
+def cache(ttl=CACHE_TTL):
+    """Cache a user-keyed JSON payload builder"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(user_id, *args):
+            # User id sits right after the prefix so invalidate_user can match it exactly
+            key = ":".join([CACHE_PREFIX, str(user_id), func.__name__] + [str(a) for a in args])
+            payload = _cache_get(key)
+            if payload is None:
+                payload = func(user_id, *args)
+                _cache_set(key, payload, ttl)
+            return payload
+        return wrapper
+    return decorator
+
 # Initialize engine (outside routes to avoid reload issues)
 print("🔄 Initializing recommendation engine...")
 try:
     engine = RecommenderEngine()
     explainer = LLMExplainer()
+    engine.on_invalidate(invalidate_user)
     print("✅ Engine initialized successfully!")
 except Exception as e:
     print(f"❌ Error initializing engine: {e}")
@@ -34,12 +155,34 @@ def home():
         "status": "active",
         "endpoints": {
             "/api/recommendations/<user_id>": "Get recommendations for user",
-            "/api/users": "Get available users", 
+            "/api/users": "Get available users (?offset=0&limit=20)", 
             "/api/statistics": "Get system stats",
             "/api/user/<user_id>/history": "Get user purchase history"
         }
     })
 
+@cache()
+def recommendations_payload(user_id, n_recommendations, rec_type):
+    """Build the recommendations response for a user"""
+    # Get recommendations
+    recommendations = engine.hybrid_recommendations(user_id, n_recommendations)
+    products = engine.get_product_details(recommendations)
+    
+    # Get user history for explanations
+    user_history = engine.get_user_history(user_id)
+    
+    # Add explanations to each product
+    context = explainer.prepare_context(engine, user_history)
+    for product in products:
+        product['explanation'] = explainer.format(product, context)
+    
+    return {
+        "user_id": user_id,
+        "recommendations": products,
+        "count": len(products),
+        "status": "success"
+    }
+
 @app.route('/api/recommendations/<int:user_id>')
 def get_recommendations(user_id):
     """Get recommendations for a user"""
@@ -47,24 +190,7 @@ def get_recommendations(user_id):
         return jsonify({"error": "Engine not initialized", "status": "error"}), 500
         
     try:
-        # Get recommendations
-        recommendations = engine.hybrid_recommendations(user_id, 5)
-        products = engine.get_product_details(recommendations)
-        
-        # Get user history for explanations
-        user_history = engine.get_user_history(user_id)
-        
-        # Add explanations to each product
-        for product in products:
-            explanation = explainer.generate_explanation(engine, product, user_history)
-            product['explanation'] = explanation
-        
-        return jsonify({
-            "user_id": user_id,
-            "recommendations": products,
-            "count": len(products),
-            "status": "success"
-        })
+        return jsonify(recommendations_payload(user_id, 5, "hybrid"))
     
     except Exception as e:
         return jsonify({"error": str(e), "status": "error"}), 500
@@ -76,10 +202,14 @@ def get_users():
         return jsonify({"error": "Engine not initialized", "status": "error"}), 500
         
     try:
-        users = sorted(engine.interactions_df['user_id'].unique().tolist()[:20])
+        offset = request.args.get('offset', 0, type=int)
+        limit = request.args.get('limit', 20, type=int)
+        page = engine.get_users(offset, limit)
         return jsonify({
-            "users": users,
-            "count": len(users),
+            "users": page['users'],
+            "count": len(page['users']),
+            "offset": page['offset'],
+            "limit": page['limit'],
             "status": "success"
         })
     except Exception as e:
@@ -98,6 +228,19 @@ def get_statistics():
     except Exception as e:
         return jsonify({"error": str(e), "status": "error"}), 500
 
+@cache()
+def history_payload(user_id):
+    """Build the purchase history response for a user"""
+    purchases = engine.get_user_purchases(user_id)
+    purchased_products = engine.get_product_details(purchases['product_id'].values)
+    
+    return {
+        "user_id": user_id,
+        "purchase_history": purchased_products,
+        "total_purchases": len(purchased_products),
+        "status": "success"
+    }
+
 @app.route('/api/user/<int:user_id>/history')
 def get_user_history(user_id):
     """Get user purchase history"""
@@ -105,16 +248,7 @@ def get_user_history(user_id):
         return jsonify({"error": "Engine not initialized", "status": "error"}), 500
         
     try:
-        user_history = engine.get_user_history(user_id)
-        purchases = user_history[user_history['interaction_type'] == 'purchase']
-        purchased_products = engine.get_product_details(purchases['product_id'].values)
-        
-        return jsonify({
-            "user_id": user_id,
-            "purchase_history": purchased_products,
-            "total_purchases": len(purchased_products),
-            "status": "success"
-        })
+        return jsonify(history_payload(user_id))
     except Exception as e:
         return jsonify({"error": str(e), "status": "error"}), 500
 
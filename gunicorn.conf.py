@@ -0,0 +1,21 @@
+"""
+Gunicorn settings for E-commerce Recommender
+File: gunicorn.conf.py
+"""
+
+import multiprocessing
+import os
+
+bind = "0.0.0.0:5000"
+
+# Threaded workers: NumPy/SciPy release the GIL, so requests overlap
+worker_class = "gthread"
+workers = multiprocessing.cpu_count() * 2 + 1
+threads = 8
+
+# Build the RecommenderEngine once before forking; workers share it copy-on-write
+preload_app = True
+
+# Heartbeat files on tmpfs avoid stalls on disk-backed /tmp (Linux only)
+if os.path.isdir("/dev/shm"):
+    worker_tmp_dir = "/dev/shm"
@@ -11,20 +11,95 @@ File: recommender_engine.py
 
 import pandas as pd
 import numpy as np
+import hashlib
+import os
+import re
 import sqlite3
-from sklearn.metrics.pairwise import cosine_similarity
+import scipy.sparse as sp
+from sklearn.metrics.pairwise import cosine_similarity, linear_kernel
 from sklearn.feature_extraction.text import TfidfVectorizer
 import warnings
 warnings.filterwarnings('ignore')
 
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+# Bump when the cached matrices change shape or meaning
+MODEL_CACHE_VERSION = 2
+
+# Catalogues at least this large drop TF-IDF terms that occur in one product
+TFIDF_PRUNE_MIN_PRODUCTS = 1000
+
+CATEGORY_KEYWORDS = {
+    'Electronics': ['headphone', 'mouse', 'charger', 'laptop', 'phone'],
+    'Sports & Fitness': ['yoga', 'fitness', 'sport', 'gym', 'exercise'],
+    'Books': ['book', 'novel', 'planner'],
+    'Home & Kitchen': ['kitchen', 'pan', 'coffee', 'bottle', 'knife'],
+    'Fashion': ['shoes', 'jacket', 'backpack', 'glasses']
+}
+
+
+def _top_k(scores, k):
+    """Indices of the k highest scores, best first"""
+    if k <= 0 or len(scores) == 0:
+        return np.array([], dtype=int)
+    neg_scores = -scores
+    if k >= len(scores):
+        return np.argsort(neg_scores, kind='stable')
+    # argpartition returns the winners in arbitrary order; sort them by index
+    # first so the stable argsort breaks ties lowest index first
+    top = np.sort(np.argpartition(neg_scores, k - 1)[:k])
+    return top[np.argsort(neg_scores[top], kind='stable')]
+
+
+def _accumulate_neighbour_scores(rows, weights, indptr, indices, owned, scores, candidates):
+    """Scatter-add neighbour similarity onto products the user does not own"""
+    for j in range(len(rows)):
+        u = rows[j]
+        for k in range(indptr[u], indptr[u + 1]):
+            product = indices[k]
+            if not owned[product]:
+                scores[product] += weights[j]
+                candidates[product] = True
+
+
+# Only worth it compiled; without numba the sparse mat-vec path is used
+if njit is not None:
+    _accumulate_neighbour_scores = njit(cache=True, nogil=True)(_accumulate_neighbour_scores)
+else:
+    _accumulate_neighbour_scores = None
+
 
 class RecommenderEngine:
     """Hybrid recommendation engine"""
     
-    def __init__(self, db_name='ecommerce_recommender.db'):
+    def __init__(self, db_name='ecommerce_recommender.db', cache_dir=None):
         self.db_name = db_name
+        # Precomputed matrices are persisted next to the database by default
+        self.cache_dir = cache_dir or os.path.join(
+            os.path.dirname(os.path.abspath(db_name)), '.cache'
+        )
+        self._cache_key = None
         self.products_df = None
         self.interactions_df = None
+        self._product_ids = np.array([], dtype=int)
+        self._product_rows = {}
+        self._products_by_id = {}
+        self._num_products = 0
+        self._by_user = {}
+        self._purchases_by_user = {}
+        self._empty_history = pd.DataFrame()
+        self._sorted_users = np.array([], dtype=int)
+        self._tfidf_matrix = None
+        self._upm_csr = None
+        self._upm_binary = None
+        self._user_sim = None
+        self._upm_user_ids = None
+        self._upm_product_ids = None
+        self._user_rows = {}
+        self._invalidation_callbacks = []
         self.load_data()
     
     def load_data(self):
@@ -34,121 +109,310 @@ class RecommenderEngine:
             self.products_df = pd.read_sql_query("SELECT * FROM products", conn)
             self.interactions_df = pd.read_sql_query("SELECT * FROM interactions", conn)
             conn.close()
+            
+            # Narrow dtypes to halve memory traffic in the similarity kernels
+            self.products_df = self.products_df.astype({'id': 'int32'})
+            self.interactions_df = self.interactions_df.astype({
+                'user_id': 'int32',
+                'product_id': 'int32',
+                'rating': 'float32'
+            })
+            self._cache_key = self._make_cache_key()
             print(f"✅ Data loaded: {len(self.products_df)} products, {len(self.interactions_df)} interactions")
         except Exception as e:
             print(f"❌ Error loading data: {e}")
             # Create empty DataFrames if database doesn't exist
             self.products_df = pd.DataFrame()
             self.interactions_df = pd.DataFrame()
+            self._cache_key = None
+        self._build_product_index()
+        self._build_user_index()
+        self._build_content_model()
+        self._build_collaborative_model()
     
-    def get_user_history(self, user_id):
-        """Get user interaction history"""
-        if self.interactions_df is None or len(self.interactions_df) == 0:
-            return pd.DataFrame()
-        return self.interactions_df[self.interactions_df['user_id'] == user_id]
+    def _make_cache_key(self):
+        """Fingerprint the database path and contents for the on-disk matrix cache"""
+        db_path = os.path.abspath(self.db_name)
+        path_hash = hashlib.md5(db_path.encode()).hexdigest()[:8]
+        raw = ':'.join(str(part) for part in (
+            MODEL_CACHE_VERSION,
+            db_path,
+            os.path.getmtime(self.db_name),
+            len(self.products_df),
+            len(self.interactions_df)
+        ))
+        return path_hash, hashlib.md5(raw.encode()).hexdigest()[:16]
     
-    def collaborative_filtering(self, user_id, n_recommendations=5):
-        """Collaborative filtering recommendations"""
-        if len(self.interactions_df) == 0:
-            return []
+    def _cache_filename(self, name):
+        path_hash, content_hash = self._cache_key
+        return f"{name}_{path_hash}_{content_hash}.npz"
+    
+    def _load_cached_matrix(self, name):
+        """Load a sparse matrix saved for the current database contents"""
+        if self._cache_key is None:
+            return None
+        path = os.path.join(self.cache_dir, self._cache_filename(name))
+        if not os.path.exists(path):
+            return None
+        try:
+            return sp.load_npz(path)
+        except Exception as e:
+            print(f"⚠️ Ignoring unreadable cache file {path}: {e}")
+            return None
+    
+    def _save_cached_matrix(self, name, matrix):
+        """Persist a sparse matrix and drop older versions for the same database"""
+        if self._cache_key is None:
+            return
+        filename = self._cache_filename(name)
+        path = os.path.join(self.cache_dir, filename)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # Write then rename so concurrent workers never read a partial file
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                sp.save_npz(f, matrix)
+            os.replace(tmp_path, path)
             
-        purchase_data = self.interactions_df[
+            # Other databases sharing the cache dir have a different path hash
+            prefix = f"{name}_{self._cache_key[0]}_"
+            for stale in os.listdir(self.cache_dir):
+                if stale.startswith(prefix) and stale.endswith('.npz') and stale != filename:
+                    os.remove(os.path.join(self.cache_dir, stale))
+        except OSError as e:
+            print(f"⚠️ Could not write cache file {path}: {e}")
+    
+    def _build_product_index(self):
+        """Map product ids to contiguous row positions in products_df"""
+        if len(self.products_df) == 0:
+            self._product_ids = np.array([], dtype=int)
+            self._products_by_id = {}
+        else:
+            self._product_ids = self.products_df['id'].to_numpy()
+            self._products_by_id = {
+                product['id']: product
+                for product in self.products_df.to_dict('records')
+            }
+        self._product_rows = {pid: i for i, pid in enumerate(self._product_ids)}
+        self._num_products = len(self._product_ids)
+    
+    def _build_user_index(self):
+        """Group interactions by user once so lookups skip full-column scans"""
+        self._by_user = {}
+        self._purchases_by_user = {}
+        self._empty_history = self.interactions_df.iloc[0:0]
+        self._sorted_users = np.array([], dtype=int)
+        if len(self.interactions_df) == 0:
+            return
+        
+        self._sorted_users = np.unique(self.interactions_df['user_id'].to_numpy())
+        
+        self._by_user = {
+            user_id: history
+            for user_id, history in self.interactions_df.groupby('user_id', sort=False)
+        }
+        purchases = self.interactions_df[
             self.interactions_df['interaction_type'] == 'purchase'
         ]
+        self._purchases_by_user = {
+            user_id: history
+            for user_id, history in purchases.groupby('user_id', sort=False)
+        }
+    
+    def _build_content_model(self):
+        """Fit the TF-IDF model once so requests only do row lookups"""
+        self._tfidf_matrix = None
+        if len(self.products_df) == 0:
+            return
+        
+        self.products_df['content'] = (
+            self.products_df['category'].fillna('').astype(str) + ' ' +
+            self.products_df['description'].fillna('').astype(str)
+        )
+        
+        self._tfidf_matrix = self._load_cached_matrix('tfidf')
+        if self._tfidf_matrix is not None:
+            return
+        
+        # Single-product terms add no cross-product overlap but still shape each
+        # row's norm; small catalogues keep them so descriptions matter, and
+        # large ones prune them (min_df=2) unless nothing would be left
+        if len(self.products_df) >= TFIDF_PRUNE_MIN_PRODUCTS:
+            min_df_options = (2, 1)
+        else:
+            min_df_options = (1,)
+        for min_df in min_df_options:
+            vectorizer = TfidfVectorizer(
+                stop_words='english',
+                max_features=20000,
+                min_df=min_df,
+                dtype=np.float32,
+                sublinear_tf=True
+            )
+            try:
+                self._tfidf_matrix = vectorizer.fit_transform(self.products_df['content'])
+                break
+            except ValueError:
+                continue
+        
+        if self._tfidf_matrix is not None:
+            self._save_cached_matrix('tfidf', self._tfidf_matrix.tocsr())
+    
+    def _build_collaborative_model(self):
+        """Cache the user-product purchase matrix and user similarities"""
+        self._upm_csr = None
+        self._upm_binary = None
+        self._user_sim = None
+        self._upm_user_ids = None
+        self._upm_product_ids = None
+        self._user_rows = {}
+        if len(self.interactions_df) == 0:
+            return
         
+        purchase_data = self.interactions_df[
+            (self.interactions_df['interaction_type'] == 'purchase') &
+            self.interactions_df['rating'].notna()
+        ]
         if len(purchase_data) == 0:
-            return []
+            return
         
-        user_product_matrix = purchase_data.pivot_table(
-            index='user_id',
-            columns='product_id',
-            values='rating',
-            fill_value=0
-        )
+        # Build the sparse matrix straight from (user, product) codes
+        user_codes = pd.Categorical(purchase_data['user_id'])
+        product_codes = pd.Categorical(purchase_data['product_id'])
+        coords = (user_codes.codes, product_codes.codes)
+        shape = (len(user_codes.categories), len(product_codes.categories))
+        ratings = purchase_data['rating'].to_numpy(dtype='float32')
+        
+        # Repeated purchases sum in tocsr(); divide by counts to average them
+        rating_sums = sp.coo_matrix((ratings, coords), shape=shape).tocsr()
+        counts = sp.coo_matrix((np.ones_like(ratings), coords), shape=shape).tocsr()
+        rating_sums.data /= counts.data
+        
+        self._upm_user_ids = user_codes.categories.to_numpy()
+        self._upm_product_ids = product_codes.categories.to_numpy()
+        self._user_rows = {uid: i for i, uid in enumerate(self._upm_user_ids)}
+        self._upm_csr = rating_sums
+        self._upm_binary = (rating_sums > 0).astype(np.float32)
         
-        if user_id not in user_product_matrix.index:
+        self._user_sim = self._load_cached_matrix('usersim')
+        if self._user_sim is None:
+            self._user_sim = cosine_similarity(self._upm_csr, dense_output=False)
+            self._save_cached_matrix('usersim', self._user_sim.tocsr())
+    
+    def on_invalidate(self, callback):
+        """Register a callback run when a user's interactions change"""
+        self._invalidation_callbacks.append(callback)
+    
+    def invalidate_user(self, user_id):
+        """Drop anything cached for a user after their interactions change"""
+        for callback in self._invalidation_callbacks:
+            callback(user_id)
+    
+    def get_users(self, offset=0, limit=20):
+        """Get a page of user IDs in ascending order, with the offset/limit applied"""
+        offset = max(offset, 0)
+        limit = max(limit, 0)
+        return {
+            'users': self._sorted_users[offset:offset + limit].tolist(),
+            'offset': offset,
+            'limit': limit
+        }
+    
+    def get_user_history(self, user_id):
+        """Get user interaction history"""
+        if self.interactions_df is None or len(self.interactions_df) == 0:
+            return pd.DataFrame()
+        return self._by_user.get(user_id, self._empty_history)
+    
+    def get_user_purchases(self, user_id):
+        """Get user purchase interactions"""
+        if self.interactions_df is None or len(self.interactions_df) == 0:
+            return pd.DataFrame()
+        return self._purchases_by_user.get(user_id, self._empty_history)
+    
+    def collaborative_filtering(self, user_id, n_recommendations=5):
+        """Collaborative filtering recommendations"""
+        if self._upm_csr is None or user_id not in self._user_rows:
             return []
         
-        user_similarity = cosine_similarity(user_product_matrix)
-        user_similarity_df = pd.DataFrame(
-            user_similarity,
-            index=user_product_matrix.index,
-            columns=user_product_matrix.index
-        )
+        user_row = self._user_rows[user_id]
+        sim_row = self._user_sim[user_row].toarray().ravel()
+        sim_row[user_row] = -np.inf
+        similar_rows = _top_k(sim_row, 5)
         
-        similar_users = user_similarity_df[user_id].sort_values(ascending=False)[1:6]
-        user_products = set(user_product_matrix.columns[user_product_matrix.loc[user_id] > 0])
+        # Candidates are products a neighbour bought and the user has not
+        indptr = self._upm_binary.indptr
+        indices = self._upm_binary.indices
+        n_products = len(self._upm_product_ids)
+        owned = np.zeros(n_products, dtype=bool)
+        owned[indices[indptr[user_row]:indptr[user_row + 1]]] = True
         
-        recommendations = {}
-        for similar_user_id, similarity_score in similar_users.items():
-            similar_user_products = set(
-                user_product_matrix.columns[user_product_matrix.loc[similar_user_id] > 0]
+        if _accumulate_neighbour_scores is not None:
+            scores = np.zeros(n_products, dtype=np.float32)
+            candidates = np.zeros(n_products, dtype=bool)
+            _accumulate_neighbour_scores(
+                similar_rows, sim_row[similar_rows], indptr, indices,
+                owned, scores, candidates
             )
-            new_products = similar_user_products - user_products
-            
-            for product_id in new_products:
-                if product_id not in recommendations:
-                    recommendations[product_id] = 0
-                recommendations[product_id] += similarity_score
+        else:
+            similar_products = self._upm_binary[similar_rows]
+            scores = similar_products.T @ sim_row[similar_rows]
+            candidates = np.zeros(n_products, dtype=bool)
+            candidates[similar_products.indices] = True
+            candidates &= ~owned
         
-        top_products = sorted(recommendations.items(), key=lambda x: x[1], reverse=True)
-        return [p[0] for p in top_products[:n_recommendations]]
+        candidate_idx = np.flatnonzero(candidates)
+        top_idx = candidate_idx[_top_k(scores[candidate_idx], n_recommendations)]
+        return self._upm_product_ids[top_idx].tolist()
     
     def content_based_filtering(self, user_id, n_recommendations=5):
         """Content-based filtering recommendations"""
-        if len(self.products_df) == 0 or len(self.interactions_df) == 0:
+        if self._tfidf_matrix is None or len(self.interactions_df) == 0:
             return []
             
-        user_purchases = self.interactions_df[
-            (self.interactions_df['user_id'] == user_id) &
-            (self.interactions_df['interaction_type'] == 'purchase')
-        ]['product_id'].unique()
+        user_purchases = self.get_user_purchases(user_id)['product_id'].unique()
         
         if len(user_purchases) == 0:
-            user_views = self.interactions_df[
-                (self.interactions_df['user_id'] == user_id) &
-                (self.interactions_df['interaction_type'] == 'view')
+            user_history = self.get_user_history(user_id)
+            user_views = user_history[
+                user_history['interaction_type'] == 'view'
             ]['product_id'].unique()
             user_purchases = user_views[:3] if len(user_views) > 0 else [1, 2, 3]
         
-        self.products_df['content'] = (
-            self.products_df['category'] + ' ' + 
-            self.products_df['description']
-        )
-        
-        tfidf = TfidfVectorizer(stop_words='english')
-        tfidf_matrix = tfidf.fit_transform(self.products_df['content'])
-        content_similarity = cosine_similarity(tfidf_matrix, tfidf_matrix)
+        purchased_rows = [
+            self._product_rows[product_id]
+            for product_id in user_purchases
+            if product_id in self._product_rows
+        ]
+        if len(purchased_rows) == 0:
+            return []
         
-        recommendations = set()
-        for product_id in user_purchases:
-            product_idx = product_id - 1
-            similar_indices = content_similarity[product_idx].argsort()[-6:-1][::-1]
-            
-            for idx in similar_indices:
-                similar_product_id = self.products_df.iloc[idx]['id']
-                if similar_product_id not in user_purchases:
-                    recommendations.add(similar_product_id)
+        # TF-IDF rows are L2-normalised, so a plain dot product is the cosine;
+        # summing over purchases weights products similar to several of them
+        scores = linear_kernel(
+            self._tfidf_matrix[purchased_rows], self._tfidf_matrix
+        ).sum(axis=0)
+        scores[purchased_rows] = -np.inf
         
-        return list(recommendations)[:n_recommendations]
+        candidates = np.flatnonzero(np.isfinite(scores))
+        top = candidates[_top_k(scores[candidates], n_recommendations)]
+        return self._product_ids[top].tolist()
     
     def hybrid_recommendations(self, user_id, n_recommendations=5):
         """Hybrid recommendations (60% collab, 40% content)"""
         collab_recs = self.collaborative_filtering(user_id, n_recommendations)
         content_recs = self.content_based_filtering(user_id, n_recommendations)
         
-        all_recs = {}
-        for i, product_id in enumerate(collab_recs):
-            all_recs[product_id] = (len(collab_recs) - i) * 0.6
+        scores = np.zeros(self._num_products)
+        for recs, weight in ((collab_recs, 0.6), (content_recs, 0.4)):
+            rows = np.array([self._product_rows.get(p, -1) for p in recs], dtype=int)
+            ranks = np.arange(len(recs), 0, -1)
+            known = rows >= 0
+            scores[rows[known]] += weight * ranks[known]
         
-        for i, product_id in enumerate(content_recs):
-            if product_id in all_recs:
-                all_recs[product_id] += (len(content_recs) - i) * 0.4
-            else:
-                all_recs[product_id] = (len(content_recs) - i) * 0.4
-        
-        sorted_recs = sorted(all_recs.items(), key=lambda x: x[1], reverse=True)
-        return [p[0] for p in sorted_recs[:n_recommendations]]
+        candidates = np.flatnonzero(scores > 0)
+        top = candidates[_top_k(scores[candidates], n_recommendations)]
+        return self._product_ids[top].tolist()
     
     def get_product_details(self, product_ids):
         """Get detailed information for given product IDs"""
@@ -156,8 +420,11 @@ class RecommenderEngine:
         if product_ids is None or len(product_ids) == 0:
             return []
         
-        products = self.products_df[self.products_df['id'].isin(product_ids)]
-        return products.to_dict('records')
+        return [
+            dict(self._products_by_id[product_id])
+            for product_id in dict.fromkeys(product_ids)
+            if product_id in self._products_by_id
+        ]
     
     def get_statistics(self):
         """Get system statistics"""
@@ -194,38 +461,37 @@ class LLMExplainer:
     
     def __init__(self):
         self.fallback_mode = True
+        self._category_patterns = {
+            category: re.compile('|'.join(map(re.escape, keywords)))
+            for category, keywords in CATEGORY_KEYWORDS.items()
+        }
     
-    def generate_explanation(self, recommender_engine, product, user_history):
-        """Generate explanation"""
+    def prepare_context(self, recommender_engine, user_history):
+        """Look up purchased product names once per request"""
         purchased_products = user_history[
             user_history['interaction_type'] == 'purchase'
         ]['product_id'].values
         
-        purchased_names = []
-        if len(purchased_products) > 0:
-            purchased_df = recommender_engine.products_df[
-                recommender_engine.products_df['id'].isin(purchased_products)
-            ]
-            purchased_names = purchased_df['name'].tolist()
-        
-        return self._generate_smart_explanation(product, purchased_names)
+        purchased_details = recommender_engine.get_product_details(purchased_products)
+        return [product['name'] for product in purchased_details]
+    
+    def format(self, product, context):
+        """Explain one product using a context from prepare_context"""
+        return self._generate_smart_explanation(product, context)
+    
+    def generate_explanation(self, recommender_engine, product, user_history):
+        """Generate explanation"""
+        context = self.prepare_context(recommender_engine, user_history)
+        return self.format(product, context)
     
     def _generate_smart_explanation(self, product, purchased_names):
         """Generate smart explanation"""
         if purchased_names:
             categories = set()
-            category_keywords = {
-                'Electronics': ['headphone', 'mouse', 'charger', 'laptop', 'phone'],
-                'Sports & Fitness': ['yoga', 'fitness', 'sport', 'gym', 'exercise'],
-                'Books': ['book', 'novel', 'planner'],
-                'Home & Kitchen': ['kitchen', 'pan', 'coffee', 'bottle', 'knife'],
-                'Fashion': ['shoes', 'jacket', 'backpack', 'glasses']
-            }
-            
             for name in purchased_names:
                 name_lower = name.lower()
-                for category, keywords in category_keywords.items():
-                    if any(keyword in name_lower for keyword in keywords):
+                for category, pattern in self._category_patterns.items():
+                    if category not in categories and pattern.search(name_lower):
                         categories.add(category)
             
             if categories:
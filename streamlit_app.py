@@ -77,7 +77,7 @@ def main():
     st.sidebar.title("🔧 Configuration")
     
     # Get available users
-    available_users = sorted(engine.interactions_df['user_id'].unique()[:20])
+    available_users = engine.get_users(limit=20)['users']
     
     # User selection
     user_id = st.sidebar.selectbox(
@@ -122,6 +122,7 @@ def main():
             # Get user history for explanations
             user_history = engine.get_user_history(user_id)
             explainer = LLMExplainer()
+            explanation_context = explainer.prepare_context(engine, user_history)
             
             # Display recommendations
             if recommended_products:
@@ -140,7 +141,7 @@ def main():
                         
                         with col_b:
                             # Generate explanation
-                            explanation = explainer.generate_explanation(engine, product, user_history)
+                            explanation = explainer.format(product, explanation_context)
                             st.markdown(f'<div class="explanation-box">💡 {explanation}</div>', unsafe_allow_html=True)
                         
                         st.markdown('</div>', unsafe_allow_html=True)
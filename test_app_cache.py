@@ -0,0 +1,59 @@
+"""
+Checks for the per-user response cache in app.py
+File: test_app_cache.py
+"""
+
+import fnmatch
+
+import app
+
+
+class FakeRedis:
+    """Just enough of redis-py for the cache helpers"""
+
+    def __init__(self):
+        self.store = {}
+
+    def get(self, key):
+        return self.store.get(key)
+
+    def setex(self, key, ttl, value):
+        self.store[key] = value
+
+    def scan_iter(self, match):
+        return [k for k in list(self.store) if fnmatch.fnmatchcase(k, match)]
+
+    def delete(self, key):
+        self.store.pop(key, None)
+
+
+def _cache_keys():
+    if app.redis_client is not None:
+        return sorted(app.redis_client.store)
+    return sorted(app._local_cache)
+
+
+def _check_invalidate_user():
+    client = app.app.test_client()
+    for user_id in (1, 5):
+        client.get(f'/api/recommendations/{user_id}')
+        client.get(f'/api/user/{user_id}/history')
+    assert len(_cache_keys()) == 4
+
+    # User 5 must not take user 1's "n=5" recommendations entry with it
+    app.engine.invalidate_user(5)
+    assert _cache_keys() == [
+        'recommender:1:history_payload',
+        'recommender:1:recommendations_payload:5:hybrid',
+    ]
+
+
+def test_invalidate_user_local_cache():
+    app._local_cache.clear()
+    _check_invalidate_user()
+    app._local_cache.clear()
+
+
+def test_invalidate_user_redis(monkeypatch):
+    monkeypatch.setattr(app, 'redis_client', FakeRedis())
+    _check_invalidate_user()
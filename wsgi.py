@@ -0,0 +1,8 @@
+"""
+WSGI entrypoint for E-commerce Recommender
+File: wsgi.py
+
+Run with: gunicorn -c gunicorn.conf.py wsgi:app
+"""
+
+from app import app  # noqa: F401